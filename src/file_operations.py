@@ -1,44 +1,76 @@
-import os, PyPDF2, docx2txt
+import os
 from os import path
 
+# The document libraries (docx2txt, pypdfium2, PyPDF2) are imported inside their readers, on first use
+
 BASE_DIR = path.dirname(__file__)
 
 DATA_FOLDER = path.join(BASE_DIR, "data")
 CONFIG_FILE = path.join(BASE_DIR, "config.xml")
+CACHE_FOLDER = path.join(path.expanduser("~"), ".cache", "mining_resume")
+
+# Both PDF readers join pages with it, so a PDF gives the same text, sections and cache keys whichever is installed
+PDF_PAGE_SEPARATOR = "\n"
+
+
+# Returns the paths of the resumes in a folder whose extension has a reader
+def list_documents(data_folder_path):
+    # scandir entries carry the file type from the directory listing, no extra stat per file
+    with os.scandir(data_folder_path) as entries:
+        return [entry.path for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in EXTENSION_READERS]
+
 
+# Returns the text of a single resume, or None if its extension is not supported
+def read_document(file_path):
+    reader = EXTENSION_READERS.get(os.path.splitext(file_path)[1].lower())
+    if reader is None:
+        return None
+    return reader(file_path)
 
-def read_data(data_folder_path):
-    resume_texts = []
-    for filename in os.listdir(data_folder_path):
-        extension = os.path.splitext(filename)[1]
-        resume_text = None
-        if extension == ".txt":
-            with open(os.path.join(data_folder_path, filename), 'r') as file:
-                resume_text = file.read()
-        elif extension == ".pdf":
-            resume_text = pdf_to_txt(os.path.join(data_folder_path, filename))
-        elif extension == ".docx":
-            resume_text = docx_to_txt(os.path.join(data_folder_path, filename))
 
-        if resume_text:
-            result_dict = {'filename': filename, 'resume_text': resume_text}
-            resume_texts.append(result_dict)
-    return resume_texts
+def txt_to_txt(file_txt_path):
+    with open(file_txt_path, 'r') as file:
+        return file.read()
 
 
 def docx_to_txt(file_doc_path):
-    doc = docx2txt.process(file_doc_path)
-    raw = ""
-    raw += doc
-    return raw
+    import docx2txt
+    return docx2txt.process(file_doc_path)
 
 
 def pdf_to_txt(file_path):
-    pdfFile = open(file_path, "rb")  # Open resume.pdf as rb, store it in pdfFile variable
-    pdfReader = PyPDF2.PdfReader(pdfFile)  # Reads the file using PdfFileReader from PyPDF2
-    raw = ""
-    for index in range(len(pdfReader.pages)):
-        page = pdfReader.pages[index]  # Get the number of pages
-        text = page.extract_text()  # Extract the text on every page
-        raw += text
-    return raw
+    try:
+        import pypdfium2  # native PDFium text extraction, much faster than PyPDF2's pure Python parser
+    except ImportError:
+        return pypdf2_pdf_to_txt(file_path)
+    try:
+        pdf = pypdfium2.PdfDocument(file_path)
+        try:
+            return PDF_PAGE_SEPARATOR.join(page.get_textpage().get_text_range() for page in pdf)
+        finally:
+            pdf.close()
+    except pypdfium2.PdfiumError:
+        # PDFium rejects some damaged files that PyPDF2 still reads
+        return pypdf2_pdf_to_txt(file_path)
+
+
+# Fallback for environments without pypdfium2
+def pypdf2_pdf_to_txt(file_path):
+    import PyPDF2
+    page_texts = []
+    # PdfReader reads lazily from the open handle, so the file is never buffered whole
+    with open(file_path, "rb") as pdfFile:
+        pdfReader = PyPDF2.PdfReader(pdfFile)  # Reads the file using PdfFileReader from PyPDF2
+        for index in range(len(pdfReader.pages)):
+            page = pdfReader.pages[index]  # Get the number of pages
+            page_texts.append(page.extract_text() or "")  # Extract the text on every page
+    return PDF_PAGE_SEPARATOR.join(page_texts)
+
+
+# Extension to reader lookup, replaces the per-file if/elif chain on the extension
+EXTENSION_READERS = {
+    ".txt": txt_to_txt,
+    ".pdf": pdf_to_txt,
+    ".docx": docx_to_txt,
+}
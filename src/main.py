@@ -1,12 +1,16 @@
 import os
 from flask import Flask, render_template, request, flash, redirect
-from parser_by_regex import CONFIG_FILE, parse_document, read_config, read_document
+from file_operations import CONFIG_FILE, read_document
+from parser_by_regex import parse_document, read_config
 from tempfile import TemporaryDirectory
 import pathlib
 
 app = Flask(__name__)
 
-ALLOWED_EXTENSIONS = {'txt', 'pdf'}
+ALLOWED_EXTENSIONS = frozenset({'txt', 'pdf'})
+
+# config.xml is parsed once at startup, not for every uploaded file
+RESUME_CONFIG = read_config(CONFIG_FILE)
 
 TEMP_DIR = pathlib.Path(TemporaryDirectory().name)
 TEMP_DIR.mkdir(parents=True, exist_ok=True)
@@ -29,10 +33,9 @@ def parse_file():
                         file_path = TEMP_DIR / pathlib.Path(file.filename)
                         file_path.parent.mkdir(parents=True, exist_ok=True)
                         file.save(file_path)
-                        config = read_config(CONFIG_FILE)
                         document = read_document(file_path)
 
-                        result = parse_document(document, config)
+                        result = parse_document(document, RESUME_CONFIG)
                         results[file_path.name] = {}
                         for key, value in result.items():
                             results[file_path.name].update(value)
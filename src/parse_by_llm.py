@@ -1,53 +1,398 @@
+import asyncio
+import hashlib
 import os
-from langchain.chains import LLMChain, SimpleSequentialChain  # import LangChain libraries
-# from langchain.llms import OpenAI, HuggingFaceHub  # import OpenAI model
-from langchain_community.llms import HuggingFaceHub
-from langchain.prompts import PromptTemplate  # import PromptTemplate
-from file_operations import read_data, DATA_FOLDER
+import re
+import shelve
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+# The LangChain libraries are imported inside get_llm and the chain getters, on first use, so that the regex
+# pre-pass and the response parsing can be used (and tested) without them
+from file_operations import list_documents, read_document, DATA_FOLDER, CACHE_FOLDER, CONFIG_FILE
+from parser_by_regex import read_config, section_extractor
 import json
 from collections import OrderedDict
 
-# Use any one of the following
-llm = HuggingFaceHub(repo_id="bigscience/bloom", model_kwargs={"temperature": 1e-10})
+LLM_REPO_ID = "bigscience/bloom"
+# URL of a self-hosted text-generation-inference server, whose continuous batching merges the concurrent requests
+# of aparse_files_by_llm into shared forward passes. When unset, the hosted LLM_REPO_ID model is used
+LLM_ENDPOINT_URL = os.environ.get("LLM_ENDPOINT_URL")
+
+
+# The client is created on first use and shared by every caller, importing this module does not build one
+@lru_cache(maxsize=4)
+def get_llm(repo_id=LLM_REPO_ID, endpoint_url=LLM_ENDPOINT_URL):
+    # from langchain.llms import OpenAI, HuggingFaceHub  # import OpenAI model
+    from langchain_community.llms import HuggingFaceEndpoint, HuggingFaceHub
+
+    if endpoint_url:
+        return HuggingFaceEndpoint(endpoint_url=endpoint_url, temperature=1e-10)
+
+    # Use any one of the following
+    return HuggingFaceHub(repo_id=repo_id, model_kwargs={"temperature": 1e-10})
+
+    # return OpenAI(
+    #     model_name="text-curie-001",
+    #     temperature=0,
+    # )
 
-# llm = OpenAI(
-#     model_name="text-curie-001",
-#     temperature=0,
-# )
 
 attributes_list = ["Name", "Email", "Address", "Phone Number", "Objective", "Skills", "Employment History",
                    "Education History", "Accomplishments"]
 
 
-def parse_document_by_llm(text):
-    parsed_items_dict = OrderedDict()
-    prompt = """You are an expert recruiter skilled at extracting relevant information from a resume.
-    Please extract {attribute} from the resume text given as {resume}. The output should be crisp and exact with no 
+# The resume text comes before the attribute so that prompts over the same text (e.g. the contact attributes,
+# which all read the header block) share one long prefix, which providers with prompt caching bill in full once
+prompt = """You are an expert recruiter skilled at extracting relevant information from a resume.
+    Resume text:
+    {resume}
+
+    Please extract {attribute} from the resume text above. The output should be crisp and exact with no 
     extra words, not even the attribute name in the completion.
 
     Extracted value:
     """
+
+
+@lru_cache(maxsize=None)
+def get_chain():
+    from langchain.chains import LLMChain  # import LangChain libraries
+    from langchain.prompts import PromptTemplate  # import PromptTemplate
+
     prompt_template = PromptTemplate(
         input_variables=["resume", "attribute"],
         template=prompt
     )
-    chain = LLMChain(llm=llm,
-                     prompt=prompt_template)
+    return LLMChain(llm=get_llm(),
+                    prompt=prompt_template)
+
+
+# Asks for every attribute in one completion, so the resume text is sent once instead of once per attribute
+all_attributes_prompt = """You are an expert recruiter skilled at extracting relevant information from a resume.
+    Please extract {attributes} from the resume text given as {resume}. Return only a JSON object whose keys are 
+    exactly these attribute names and whose values are the extracted text, crisp and exact with no extra words. 
+    Use an empty string for an attribute that is not present.
+
+    JSON object:
+    """
+
+
+@lru_cache(maxsize=None)
+def get_all_attributes_chain():
+    from langchain.chains import LLMChain
+    from langchain.prompts import PromptTemplate
+
+    all_attributes_prompt_template = PromptTemplate(
+        input_variables=["resume", "attributes"],
+        template=all_attributes_prompt
+    )
+    return LLMChain(llm=get_llm(),
+                    prompt=all_attributes_prompt_template)
+
+
+# Section (as named in config.xml) most likely to hold each attribute, "" is the block before the first section.
+# Per-attribute prompts only carry that section, so the model reads a fraction of the resume for each of them
+ATTRIBUTE_SECTIONS = {
+    "Name": "",
+    "Email": "",
+    "Address": "",
+    "Phone Number": "",
+    "Objective": "SummarySection",
+    "Skills": "SkillSection",
+    "Employment History": "EmploymentSection",
+    "Education History": "EducationSection",
+    "Accomplishments": "HonorsSection",
+}
+
+# Number of resumes whose LLM calls may be in flight at the same time
+MAX_CONCURRENCY = 4
+
+
+# LLM responses persisted across runs, keyed by the model, the prompt, the sha256 of the text sent and the
+# requested attribute(s)
+LLM_CACHE_FILE = os.path.join(CACHE_FOLDER, "llm_responses")
+llm_cache_lock = threading.Lock()  # shelve does not support concurrent access
+# In the async parsers the shelf is opened, used and closed on this one thread, some dbm backends (dbm.sqlite3, the
+# default from Python 3.13) refuse to be used from a thread other than the one that opened them
+llm_cache_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm_cache")
+
+
+# Opened once per batch and passed down as `cache`, the folder is only created when a cache is used
+def open_llm_cache(cache_file=LLM_CACHE_FILE):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    return shelve.open(cache_file)
+
+
+def close_llm_cache(cache):
+    with llm_cache_lock:
+        cache.close()
+
+
+async def run_in_cache_thread(function, *args):
+    return await asyncio.get_running_loop().run_in_executor(llm_cache_executor, function, *args)
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+# Whitespace is collapsed first, so re-exports of a resume that only differ in line breaks or spacing share entries
+def resume_hash(text):
+    return hash_text(" ".join(text.split()))
+
+
+# The model that answers, so replies cached from another model or endpoint are never served
+def llm_identity():
+    return LLM_ENDPOINT_URL or LLM_REPO_ID
+
+
+@lru_cache(maxsize=None)
+def get_all_attributes_cache_prefix():
+    return "{}:{}".format(llm_identity(), hash_text(all_attributes_prompt))
+
+
+@lru_cache(maxsize=None)
+def get_attribute_cache_prefix():
+    return "{}:{}".format(llm_identity(), hash_text(prompt))
+
+
+# Without a cache (None) nothing is looked up or stored
+def get_cached_response(cache, cache_key):
+    if cache is None:
+        return None
+    with llm_cache_lock:
+        return cache.get(cache_key)
+
+
+def set_cached_response(cache, cache_key, response):
+    if cache is not None:
+        with llm_cache_lock:
+            cache[cache_key] = response
+
+
+# Returns parse_response(response). A reply it rejects (None) is not cached, so the next run asks again
+def run_chain(target_chain, inputs, cache, cache_key, parse_response):
+    response = get_cached_response(cache, cache_key)
+    if response is not None:
+        return parse_response(response)
+    response = target_chain.run(inputs)
+    parsed_response = parse_response(response)
+    if parsed_response is not None:
+        set_cached_response(cache, cache_key, response)
+    return parsed_response
+
+
+# The shelf is read and written on the cache thread, its file I/O does not block the event loop
+async def arun_chain(target_chain, inputs, cache, cache_key, parse_response):
+    response = await run_in_cache_thread(get_cached_response, cache, cache_key)
+    if response is not None:
+        return parse_response(response)
+    response = await target_chain.arun(inputs)
+    parsed_response = parse_response(response)
+    if parsed_response is not None:
+        await run_in_cache_thread(set_cached_response, cache, cache_key, response)
+    return parsed_response
+
+
+JSON_OBJECT_PATTERN = re.compile(r"\{.*\}", re.DOTALL)
+# Models write the attribute names in varying case and with "_" or no space ("phone_number", "PhoneNumber")
+ATTRIBUTE_KEY_SEPARATORS = re.compile(r"[\s_]+")
+
+
+def attribute_key(name):
+    return ATTRIBUTE_KEY_SEPARATORS.sub("", name).lower()
+
+
+@lru_cache(maxsize=None)
+def get_section_terms():
+    sections_term = next(term for term in read_config(CONFIG_FILE) if term.get("Method") == "section_extractor")
+    return OrderedDict(list(sections_term.items())[3:])
+
+
+EMAIL_PATTERN = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+# 9 to 15 digits with at most two separators between them
+PHONE_PATTERN = re.compile(r"\+?\(?\d(?:[() .-]{0,2}\d){8,14}")
+PHONE_PREFIX_PATTERN = re.compile(r"\+|\(\d{1,4}\)")
+PHONE_LABEL_PATTERN = re.compile(r"\b(?:phone|ph|tel|telephone|mobile|mob|cell)\b", re.IGNORECASE)
+
+
+def find_email(header_lines):
+    match = EMAIL_PATTERN.search("\n".join(header_lines))
+    return match.group(0) if match is not None else None
+
+
+# A digit run is only taken as a phone number when it is marked as one, by a country code, a bracketed area code or
+# a phone label before it on its line. Unmarked runs like "2010 2014 2018" or a 12-digit ID number, and headers with
+# several different numbers, are left to the LLM
+def find_phone_number(header_lines):
+    numbers = set()
+    for line in header_lines:
+        for match in PHONE_PATTERN.finditer(line):
+            if PHONE_PREFIX_PATTERN.match(match.group(0)) or PHONE_LABEL_PATTERN.search(line, 0, match.start()):
+                numbers.add(match.group(0))
+    return numbers.pop() if len(numbers) == 1 else None
+
+
+# Attributes found reliably without the LLM. When one is found in the block before the first section, where the
+# contact details are, the value is taken from there and the LLM is not asked for that attribute
+REGEX_ATTRIBUTES = OrderedDict([
+    ("Email", find_email),
+    ("Phone Number", find_phone_number),
+])
+
+
+# Sections of the resume as found by the rule-based parser, split once per resume and shared by the helpers below
+def split_resume_sections(text):
+    return section_extractor(text, "", get_section_terms(), None)
+
+
+def extract_attributes_by_regex(sections):
+    parsed_items_dict = OrderedDict()
+    header_lines = sections.get("")
+    if header_lines:
+        for attr, find_value in REGEX_ATTRIBUTES.items():
+            value = find_value(header_lines)
+            if value is not None:
+                parsed_items_dict[attr] = value
+    return parsed_items_dict
+
+
+# Maps every attribute to the text to send for it, the whole resume when its section is not found
+def split_resume_by_attribute(text, sections):
+    attribute_texts = OrderedDict()
     for attr in attributes_list:
-        response = chain.run({'resume': text, 'attribute': attr})
-        parsed_items_dict[attr] = response.strip()
+        lines = sections.get(ATTRIBUTE_SECTIONS.get(attr))
+        attribute_texts[attr] = "\n".join(lines) if lines else text
+    return attribute_texts
+
+
+# Returns the attribute values of a single-call response, or None if it is not a JSON object holding at least one of
+# the attributes
+def parse_all_attributes_response(response, attributes):
+    try:
+        values = json.loads(response)
+    except ValueError:
+        # models often wrap the object in prose or code fences, retry on the outermost {...} block
+        match = JSON_OBJECT_PATTERN.search(response)
+        if match is None:
+            return None
+        try:
+            values = json.loads(match.group(0))
+        except ValueError:
+            return None
+    if not isinstance(values, dict):
+        return None
+    values = {attribute_key(str(key)): value for key, value in values.items()}
+    if not any(attribute_key(attr) in values for attr in attributes):
+        return None
+
+    parsed_items_dict = OrderedDict()
+    for attr in attributes:
+        value = values.get(attribute_key(attr)) or ""
+        if isinstance(value, list):
+            value = ", ".join(str(item) for item in value)
+        parsed_items_dict[attr] = str(value).strip()
     return parsed_items_dict
 
 
-if __name__ == "__main__":
-    final_result = []
+# Work shared by parse_document_by_llm and aparse_document_by_llm before any call: the resume's hash and sections,
+# the values found by regex and the attributes left for the LLM
+def prepare_document(text):
+    sections = split_resume_sections(text)
+    regex_values = extract_attributes_by_regex(sections)
+    llm_attributes = [attr for attr in attributes_list if attr not in regex_values]
+    return resume_hash(text), sections, regex_values, llm_attributes
+
+
+# Inputs and cache key of the call that asks for all the attributes at once
+def all_attributes_request(text, text_hash, llm_attributes):
+    attributes = ", ".join(llm_attributes)
+    return ({'resume': text, 'attributes': attributes},
+            "{}:{}:{}".format(get_all_attributes_cache_prefix(), text_hash, attributes))
+
+
+# Attribute, inputs and cache key of every call of the one-attribute-at-a-time fallback. Each key hashes the exact
+# slice sent, which depends on the line structure and the config.xml Sections keywords, not the whole resume
+def attribute_requests(text, sections, llm_attributes):
+    attribute_texts = split_resume_by_attribute(text, sections)
+    return [(attr, {'resume': attribute_texts[attr], 'attribute': attr},
+             "{}:{}:{}".format(get_attribute_cache_prefix(), hash_text(attribute_texts[attr]), attr))
+            for attr in llm_attributes]
+
+
+def merge_attribute_values(regex_values, llm_values):
+    return OrderedDict((attr, regex_values.get(attr, llm_values.get(attr, ""))) for attr in attributes_list)
 
-    docs_dicts = read_data(DATA_FOLDER)
 
-    for doc_dict in docs_dicts:
-        result = parse_document_by_llm(doc_dict['resume_text'])
-        result['filename'] = doc_dict['filename']
-        final_result.append(result)
+# A failed LLM call raises, here and in aparse_document_by_llm, nothing is turned into an empty value
+def parse_document_by_llm(text, cache=None):
+    text_hash, sections, regex_values, llm_attributes = prepare_document(text)
+    inputs, cache_key = all_attributes_request(text, text_hash, llm_attributes)
+    llm_values = run_chain(get_all_attributes_chain(), inputs, cache, cache_key,
+                           lambda response: parse_all_attributes_response(response, llm_attributes))
+    if llm_values is None:
+        # the model did not return valid JSON, ask for one attribute at a time
+        llm_values = OrderedDict()
+        for attr, attribute_inputs, attribute_cache_key in attribute_requests(text, sections, llm_attributes):
+            llm_values[attr] = run_chain(get_chain(), attribute_inputs, cache, attribute_cache_key, str.strip)
+    return merge_attribute_values(regex_values, llm_values)
+
+
+# Same as parse_document_by_llm, but the per-attribute fallback calls are issued concurrently
+async def aparse_document_by_llm(text, cache=None):
+    text_hash, sections, regex_values, llm_attributes = prepare_document(text)
+    inputs, cache_key = all_attributes_request(text, text_hash, llm_attributes)
+    llm_values = await arun_chain(get_all_attributes_chain(), inputs, cache, cache_key,
+                                  lambda response: parse_all_attributes_response(response, llm_attributes))
+    if llm_values is None:
+        requests = attribute_requests(text, sections, llm_attributes)
+        responses = await asyncio.gather(*[arun_chain(get_chain(), attribute_inputs, cache, attribute_cache_key,
+                                                      str.strip)
+                                           for attr, attribute_inputs, attribute_cache_key in requests])
+        llm_values = OrderedDict((attr, response) for (attr, _, _), response in zip(requests, responses))
+    return merge_attribute_values(regex_values, llm_values)
+
+
+# Reads and parses resume files as a pipeline, text extraction of some files runs in worker threads while the
+# LLM calls of others are in flight, instead of reading every file before the first call.
+# With a cache_file (e.g. LLM_CACHE_FILE), its shelf is opened once for the whole batch
+async def aparse_files_by_llm(file_paths, max_concurrency=MAX_CONCURRENCY, cache_file=None, read_workers=None):
+    semaphore = asyncio.Semaphore(max_concurrency)
+    loop = asyncio.get_running_loop()
+    cache = await run_in_cache_thread(open_llm_cache, cache_file) if cache_file is not None else None
+
+    # documents are extracted in worker processes, PDF and DOCX text extraction is CPU bound
+    async def parse_one(file_path):
+        resume_text = await loop.run_in_executor(reader_pool, read_document, file_path)
+        if not resume_text:
+            return None
+        async with semaphore:
+            result = await aparse_document_by_llm(resume_text, cache)
+        result['filename'] = os.path.basename(file_path)
+        return result
+
+    reader_pool = ProcessPoolExecutor(max_workers=read_workers)
+    tasks = [asyncio.ensure_future(parse_one(file_path)) for file_path in file_paths]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # when one resume fails the others are stopped first, nothing uses the shelf once it is closed
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        reader_pool.shutdown(cancel_futures=True)
+        if cache is not None:
+            await run_in_cache_thread(close_llm_cache, cache)
+    return [result for result in results if result is not None]
+
+
+# Batch entry point for callers that do not run an event loop of their own
+def parse_files_by_llm(file_paths, max_concurrency=MAX_CONCURRENCY, cache_file=None, read_workers=None):
+    return asyncio.run(aparse_files_by_llm(file_paths, max_concurrency, cache_file, read_workers))
+
+
+if __name__ == "__main__":
+    final_result = parse_files_by_llm(list_documents(DATA_FOLDER), cache_file=LLM_CACHE_FILE)
 
     jason_result = json.dumps(final_result, indent=4)
     print("Final Result:\n {}".format(jason_result))
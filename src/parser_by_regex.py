@@ -1,19 +1,34 @@
+import hashlib
 import json
+import os
 import re
-import xml.etree.cElementTree as ET
-from collections import OrderedDict
+import shelve
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import xml.etree.ElementTree as ET
+from functools import lru_cache, partial
 
-from file_operations import read_data, DATA_FOLDER, CONFIG_FILE
+from file_operations import list_documents, read_document, DATA_FOLDER, CACHE_FOLDER, CONFIG_FILE
+
+# Compiled once at import, used on the full text of every resume
+LINE_SPLIT_PATTERN = re.compile(r"[\n\r]+")
+NON_EMPTY_LINE_PATTERN = re.compile(r"[^\n\r]+")
+# Year or year range ("2010 - 14") following a keyword in a section line
+YEAR_PATTERN = re.compile(r"([\d']{4})\s?-?(\d{2}[^\w+])?")
+# Separators of the keyword lists in config.xml section_value_extractor terms
+KEYWORD_SPLIT_PATTERN = re.compile(r",|:")
 
 
 def univalue_extractor(resume_text, section, sub_terms_dict, parsed_items_dict):
-    retval = OrderedDict()
+    retval = {}
     get_section_lines = parsed_items_dict["Sections"].get(section)
+    # the section is missing e.g. when the resume starts with a header, there is nothing to search
+    if get_section_lines is None:
+        return retval
     section_doc = "\n".join(get_section_lines)
     if section_doc != "NA":
         for node_tag, pattern_list in sub_terms_dict.items():
-            for pattern in pattern_list:
-                regex_pattern = re.compile(r"{}".format(pattern))
+            for regex_pattern in pattern_list:
                 match = regex_pattern.search(section_doc)
                 if match is not None and len(match.groups()) > 0 and match.group(1) != "":
                     retval[node_tag] = match.group(1)
@@ -23,7 +38,7 @@ def univalue_extractor(resume_text, section, sub_terms_dict, parsed_items_dict):
 
 # Section Information value extractor
 def section_value_extractor(resume_text, section, sub_terms_dict, parsed_items_dict):
-    retval = OrderedDict()
+    retval = {}
     single_section_lines = parsed_items_dict["Sections"].get(section)
 
     #fixing as it return an empty dictionary when there is missing section
@@ -32,12 +47,12 @@ def section_value_extractor(resume_text, section, sub_terms_dict, parsed_items_d
         return retval 
     
     for line in single_section_lines:
-        for node_tag, pattern_string in sub_terms_dict.items():
-            pattern_list = re.split(r",|:", pattern_string[0])
-            matches = [pattern for pattern in pattern_list if pattern in line]
-            if len(matches):
+        for node_tag, (any_keyword_pattern, keyword_patterns) in sub_terms_dict.items():
+            # most lines hold none of a tag's keywords, one alternation rules them out in a single scan
+            if any_keyword_pattern.search(line):
+                matches = [keyword for keyword, pattern in keyword_patterns if pattern.search(line)]
                 info_string = ", ".join(list(matches)) + " "
-                numeric_values = re.findall(r"([\d']{4})\s?-?(\d{2}[^\w+])?", line)
+                numeric_values = YEAR_PATTERN.findall(line)
                 if len(numeric_values):
                     value_list = list(numeric_values[0])
                     info_string = info_string + "-".join([value for value in value_list if value != ""])
@@ -46,79 +61,133 @@ def section_value_extractor(resume_text, section, sub_terms_dict, parsed_items_d
     return retval
 
 
-# Find if new section has started
-def is_new_section(line, sub_terms_dict):
-    new_section = ""
-    first_word_of_line = ""
-    regex_pattern = re.compile(r"^[\s]?(\w+)?[:|\s]")
-    match = regex_pattern.search(line)
-    if match is not None and len(match.groups()) > 0 and match.group(1) != "":
-        first_word_of_line = match.group(1)
-        if first_word_of_line is not None:
-            for node_tag, pattern_list in sub_terms_dict.items():
-                for pattern in pattern_list:
-                    if first_word_of_line in pattern:
-                        new_section = node_tag
-    return new_section
-
-
 # Segmentation into sections, a sentence collector
 '''
-Read line by line
-Get first token, send it to section_finder(token, sub_term_dict),returns section node_tag or ""
-Once section is found, make it current_section, and add sentences to it till, a next section is found
+One regex alternates over the header keywords of all sections, with one group per section, so a single scan over
+the resume finds every header (a keyword at the start of a line, followed by ":" or whitespace).
+Text between a header line and the next header belongs to that header's section, text before the first header
+goes to section "".
 '''
 
 
+@lru_cache(maxsize=None)
+def compile_section_pattern(section_keywords):
+    alternatives = ["({})".format("|".join(re.escape(keyword) for keyword in keywords))
+                    for node_tag, keywords in section_keywords]
+    # a MULTILINE ^ only follows "\n", the lookbehind also accepts lines ended by a bare "\r" (old Mac line endings)
+    return re.compile(r"(?:^|(?<=\r))[ \t]?(?:{})[:|\s]".format("|".join(alternatives)), re.MULTILINE)
+
+
 def section_extractor(resume_text, section, sub_terms_dict, parsed_items_dict):
-    retval = OrderedDict()
+    retval = {}
     if resume_text != "NA":
+        node_tags = list(sub_terms_dict)
+        section_pattern = compile_section_pattern(tuple(sub_terms_dict.items()))
         current_section = ""
-        lines = re.split(r'[\n\r]+', resume_text)
-        for line in lines:
-            new_section = is_new_section(line, sub_terms_dict)
-            if new_section != "":
-                current_section = new_section
-                continue
-            retval[current_section] = retval.get(current_section, []) + [line]
+        start = 0
+        for match in section_pattern.finditer(resume_text):
+            lines = NON_EMPTY_LINE_PATTERN.findall(resume_text, start, match.start())
+            if lines:
+                retval.setdefault(current_section, []).extend(lines)
+            current_section = node_tags[match.lastindex - 1]
+            # the header line itself is not part of the section
+            line_break = LINE_SPLIT_PATTERN.search(resume_text, match.start())
+            start = line_break.end() if line_break is not None else len(resume_text)
+        lines = NON_EMPTY_LINE_PATTERN.findall(resume_text, start)
+        if lines:
+            retval.setdefault(current_section, []).extend(lines)
 
     return retval
 
 
-# read config and store in equivalent internal list-of-dictionaries structure. No processing-parsing.
-def read_config(configfile):
-    tree = ET.parse(configfile)
-    root = tree.getroot()
+# Configs read more than once in a process (e.g. by the Flask app and the LLM parser) share the compiled patterns
+@lru_cache(maxsize=512)
+def compile_pattern(pattern):
+    return re.compile(pattern)
+
+
+# section_extractor patterns are comma separated header keywords
+def split_section_keywords(pattern_list):
+    return tuple(keyword.strip() for pattern in pattern_list for keyword in pattern.split(",") if keyword.strip())
+
 
+# univalue_extractor patterns are regular expressions
+def compile_univalue_patterns(pattern_list):
+    return [compile_pattern(pattern) for pattern in pattern_list]
+
+
+# section_value_extractor patterns are comma separated keywords, which must match as whole tokens,
+# so that e.g. "X" or "BE" do not hit inside other words.
+# Returns an alternation of all the keywords, plus a pattern per keyword to list every one found, including keywords
+# that overlap like "Selenium" and "Selenium Grid", which a single findall over the alternation would not report
+def compile_keyword_patterns(pattern_list):
+    keywords = [keyword.strip() for keyword in KEYWORD_SPLIT_PATTERN.split(pattern_list[0]) if keyword.strip()]
+    keyword_pattern = r"(?<!\w){}(?!\w)"
+    any_keyword_pattern = compile_pattern(keyword_pattern.format("(?:{})".format("|".join(map(re.escape, keywords)))))
+    return any_keyword_pattern, [(keyword, compile_pattern(keyword_pattern.format(re.escape(keyword))))
+                                 for keyword in keywords]
+
+
+# Extraction methods that config.xml may name, by name
+EXTRACTORS = {
+    "section_extractor": section_extractor,
+    "univalue_extractor": univalue_extractor,
+    "section_value_extractor": section_value_extractor,
+}
+
+
+# Extraction methods whose patterns are compiled when the config is read, instead of per resume
+PATTERN_COMPILERS = {
+    "section_extractor": split_section_keywords,
+    "univalue_extractor": compile_univalue_patterns,
+    "section_value_extractor": compile_keyword_patterns,
+}
+
+
+# read config and store in equivalent internal list-of-dictionaries structure, with patterns compiled.
+# Terms are built in one streamed pass, attributes are read on "start" and pattern texts on "end", and every term's
+# elements are cleared once it is stored, so the config is never held as a whole tree
+def read_config(configfile):
     config_element = []
-    for child in root:
-        term = OrderedDict()
-        term["Term"] = child.get('name', "")
-        for level1 in child:
-            term["Method"] = level1.get('name', "")
-            term["Section"] = level1.get('section', "")
-            for level2 in level1:
-                term[level2.tag] = term.get(level2.tag, []) + [level2.text]
-
-        config_element.append(term)
-    jason_result = json.dumps(config_element, indent=4)
-    # print("Specifications:\n {}".format(jason_result))
+    term = {}
+    depth = 0
+    for event, element in ET.iterparse(configfile, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 2:
+                term = {"Term": element.get('name', "")}
+            elif depth == 3:
+                term["Method"] = element.get('name', "")
+                term["Section"] = element.get('section', "")
+            continue
+
+        depth -= 1
+        if depth == 3:
+            term.setdefault(element.tag, []).append(element.text)
+        elif depth == 1:
+            compile_patterns = PATTERN_COMPILERS.get(term.get("Method"))
+            if compile_patterns is not None:
+                for node_tag, pattern_list in list(term.items())[3:]:
+                    term[node_tag] = compile_patterns(pattern_list)
+
+            config_element.append(term)
+            element.clear()
     return config_element
 
 
 # Processes document as per specifications in config and returns result in dictionary
 def parse_document(resume_text, resume_config):
-    parsed_items_dict = OrderedDict()
+    parsed_items_dict = {}
+    # nothing to extract from a file whose text could not be read, skip every term
+    if not resume_text or resume_text.isspace():
+        return parsed_items_dict
 
     for term in resume_config:
         term_name = term.get('Term')
         extraction_method = term.get('Method')
-        extraction_method_ref = globals()[extraction_method]
+        extraction_method_ref = EXTRACTORS[extraction_method]
         section = term.get("Section")  # Optional
-        sub_term_dict = OrderedDict()
-        list_of_paras = list(term.items())
-        for node_tag, pattern_list in list_of_paras[3:]:
-            sub_term_dict[node_tag] = pattern_list
+        sub_term_dict = dict(list(term.items())[3:])
         parsed_items_dict[term_name] = extraction_method_ref(resume_text, section, sub_term_dict, parsed_items_dict)
 
     # key of section extractors is not to be printed
@@ -126,17 +195,84 @@ def parse_document(resume_text, resume_config):
     return parsed_items_dict
 
 
-if __name__ == "__main__":
+# Reads and parses a single resume file, None if it has no text
+def parse_file(file_path, resume_config):
+    resume_text = read_document(file_path)
+    if not resume_text:
+        return None
+    result = parse_document(resume_text, resume_config)
+    result['filename'] = os.path.basename(file_path)
+    return result
 
-    final_result = []
 
-    config = read_config(CONFIG_FILE)
-    docs_dicts = read_data(DATA_FOLDER)
+# Parsed results persisted across runs, keyed by the parser version and the sha256 of the file and of the config it
+# was parsed with
+PARSED_CACHE_FILE = os.path.join(CACHE_FOLDER, "parsed_resumes")
+# Bump whenever a change to this module or to the readers changes what a resume parses to, so that results cached
+# by an older version are not served
+PARSER_VERSION = 1
+
+
+# Hashed in blocks, the file is never held in memory whole
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Compiled patterns are hashed by their source text, so editing config.xml invalidates the cached results
+def config_hash(resume_config):
+    config_json = json.dumps(resume_config, default=lambda pattern: pattern.pattern)
+    return hashlib.sha256(config_json.encode("utf-8")).hexdigest()
+
 
-    for doc_dict in docs_dicts:
-        result = parse_document(doc_dict['resume_text'], config)
-        result['filename'] = doc_dict['filename']
-        final_result.append(result)
+# Resumes are independent, so each one is read and parsed in a worker process, the text never crosses processes.
+# The config is pickled with each chunk of files and its section pattern is compiled once per worker
+def parse_files_in_pool(file_paths, resume_config, max_workers=None):
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(partial(parse_file, resume_config=resume_config), file_paths, chunksize=4))
+
+
+# With a cache_file (e.g. PARSED_CACHE_FILE), files parsed before with the same config are taken from it and only the
+# others are sent to the workers. Without one every file is parsed
+def parse_files(file_paths, resume_config, max_workers=None, cache_file=None):
+    if cache_file is None:
+        results = parse_files_in_pool(file_paths, resume_config, max_workers)
+    else:
+        resume_config_hash = config_hash(resume_config)
+        cache_keys = ["{}:{}:{}".format(PARSER_VERSION, file_hash(file_path), resume_config_hash)
+                      for file_path in file_paths]
+
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # only this process opens the shelf, it does not support concurrent access
+        with shelve.open(cache_file) as cache:
+            results = [cache.get(cache_key) for cache_key in cache_keys]
+            missing = [index for index, result in enumerate(results) if result is None]
+            if missing:
+                parsed_results = parse_files_in_pool([file_paths[index] for index in missing], resume_config,
+                                                     max_workers)
+                for index, result in zip(missing, parsed_results):
+                    if result is not None:
+                        cache[cache_keys[index]] = result
+                        results[index] = result
+
+    final_results = []
+    for file_path, result in zip(file_paths, results):
+        if result is not None:
+            # the same file may have been cached under another name
+            result['filename'] = os.path.basename(file_path)
+            final_results.append(result)
+    return final_results
+
+
+if __name__ == "__main__":
+
+    config = read_config(CONFIG_FILE)
+    # "--no-cache" re-parses every file instead of reusing earlier results
+    cache_file = None if "--no-cache" in sys.argv else PARSED_CACHE_FILE
+    final_result = parse_files(list_documents(DATA_FOLDER), config, cache_file=cache_file)
 
     jason_result = json.dumps(final_result, indent=4)
     print("Final Result:\n {}".format(jason_result))
@@ -0,0 +1,88 @@
+import unittest
+from collections import OrderedDict
+from parse_by_llm import attribute_key, extract_attributes_by_regex, find_email, find_phone_number, \
+    parse_all_attributes_response
+
+ATTRIBUTES = ["Name", "Phone Number", "Skills"]
+
+
+class AttributeKeyTest(unittest.TestCase):
+
+    def test_case_spaces_and_underscores_are_ignored(self):
+        for name in ["Phone Number", "phone_number", "PhoneNumber", " phone  number "]:
+            self.assertEqual(attribute_key(name), "phonenumber")
+
+
+class ParseAllAttributesResponseTest(unittest.TestCase):
+
+    def test_plain_json_object(self):
+        response = '{"Name": "Yogesh", "Phone Number": "+91 99999 99999", "Skills": ["Python", "NLP"]}'
+        self.assertEqual(parse_all_attributes_response(response, ATTRIBUTES),
+                         OrderedDict([("Name", "Yogesh"), ("Phone Number", "+91 99999 99999"),
+                                      ("Skills", "Python, NLP")]))
+
+    def test_object_wrapped_in_prose_and_code_fences(self):
+        response = 'Here is the JSON:\n```json\n{"Name": " Yogesh "}\n```\nHope this helps.'
+        self.assertEqual(parse_all_attributes_response(response, ATTRIBUTES),
+                         OrderedDict([("Name", "Yogesh"), ("Phone Number", ""), ("Skills", "")]))
+
+    def test_keys_are_normalized(self):
+        response = '{"name": "Yogesh", "phone_number": "123", "SKILLS": "Python"}'
+        self.assertEqual(parse_all_attributes_response(response, ATTRIBUTES),
+                         OrderedDict([("Name", "Yogesh"), ("Phone Number", "123"), ("Skills", "Python")]))
+        self.assertEqual(parse_all_attributes_response('{"PhoneNumber": "123"}', ["Phone Number"]),
+                         OrderedDict([("Phone Number", "123")]))
+
+    def test_reply_with_none_of_the_attributes(self):
+        self.assertIsNone(parse_all_attributes_response("{}", ATTRIBUTES))
+        self.assertIsNone(parse_all_attributes_response('{"foo": 1}', ATTRIBUTES))
+
+    def test_reply_that_is_not_an_object(self):
+        self.assertIsNone(parse_all_attributes_response("Yogesh", ATTRIBUTES))
+        self.assertIsNone(parse_all_attributes_response('["Yogesh"]', ATTRIBUTES))
+        self.assertIsNone(parse_all_attributes_response("{Name: Yogesh}", ATTRIBUTES))
+
+
+class FindPhoneNumberTest(unittest.TestCase):
+
+    def test_marked_numbers_are_found(self):
+        self.assertEqual(find_phone_number(["Yogesh Kulkarni", "+91 99999 99999"]), "+91 99999 99999")
+        self.assertEqual(find_phone_number(["(123) 456-7890"]), "(123) 456-7890")
+        self.assertEqual(find_phone_number(["Phone: 9158818989"]), "9158818989")
+        self.assertEqual(find_phone_number(["Mob 9158818989 | Email: a@b.com"]), "9158818989")
+
+    def test_unmarked_numbers_are_left_to_the_llm(self):
+        self.assertIsNone(find_phone_number(["Worked at ACME 2010 2014 2018"]))
+        self.assertIsNone(find_phone_number(["ID 1234-5678-9012"]))
+
+    def test_several_candidate_numbers_are_left_to_the_llm(self):
+        self.assertIsNone(find_phone_number(["Phone: 9158818989", "Mobile: +91 99999 99999"]))
+
+    def test_the_same_number_twice_is_found(self):
+        self.assertEqual(find_phone_number(["Phone: 9158818989", "Cell: 9158818989"]), "9158818989")
+
+
+class FindEmailTest(unittest.TestCase):
+
+    def test_email_is_found(self):
+        self.assertEqual(find_email(["Yogesh Kulkarni", "Email: yogesh.kulkarni+cv@example.co.in, Pune"]),
+                         "yogesh.kulkarni+cv@example.co.in")
+
+    def test_text_without_email(self):
+        self.assertIsNone(find_email(["Yogesh Kulkarni @ Pune"]))
+
+
+class ExtractAttributesByRegexTest(unittest.TestCase):
+
+    def test_values_are_taken_from_the_header_block(self):
+        sections = {"": ["Yogesh Kulkarni", "a@b.com | Phone: 9158818989"], "Skills": ["c@d.com +91 99999 99999"]}
+        self.assertEqual(extract_attributes_by_regex(sections),
+                         OrderedDict([("Email", "a@b.com"), ("Phone Number", "9158818989")]))
+
+    def test_missing_values_are_left_out(self):
+        self.assertEqual(extract_attributes_by_regex({"": ["Yogesh Kulkarni"]}), OrderedDict())
+        self.assertEqual(extract_attributes_by_regex({"Skills": ["a@b.com"]}), OrderedDict())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+from collections import OrderedDict
+from parser_by_regex import compile_keyword_patterns, section_value_extractor
+
+
+def extract_values(lines, keywords):
+    parsed_items_dict = {"Sections": {"Skills": lines}}
+    sub_terms_dict = OrderedDict([("Languages", compile_keyword_patterns([keywords]))])
+    return section_value_extractor("", "Skills", sub_terms_dict, parsed_items_dict)
+
+
+class KeywordBoundaryTest(unittest.TestCase):
+
+    def test_keyword_inside_a_word_is_not_matched(self):
+        self.assertEqual(extract_values(["BEST employee award"], "BE, X"), {})
+
+    def test_keyword_as_a_token_is_matched(self):
+        self.assertEqual(extract_values(["BE in Mechanics"], "BE, X"), {"Languages": "BE "})
+
+    def test_keywords_next_to_punctuation_are_matched(self):
+        self.assertEqual(extract_values(["(C++), Java."], "C++, Java, JavaScript"), {"Languages": "C++, Java "})
+
+    def test_overlapping_keywords_are_all_listed(self):
+        self.assertEqual(extract_values(["Selenium Grid"], "Selenium, Selenium Grid"),
+                         {"Languages": "Selenium, Selenium Grid "})
+
+    def test_year_range_follows_the_keywords(self):
+        self.assertEqual(extract_values(["BE 2010-14 "], "BE"), {"Languages": "BE 2010-14 "})
+
+    def test_missing_section_gives_no_values(self):
+        sub_terms_dict = OrderedDict([("Languages", compile_keyword_patterns(["BE"]))])
+        self.assertEqual(section_value_extractor("", "Skills", sub_terms_dict, {"Sections": {}}), {})
+
+
+if __name__ == "__main__":
+    unittest.main()